@@ -14,6 +14,15 @@ class Config:
         "postgresql://postgres:postgres@db:5432/freela_facility_secondary"
     )
 
+    # Pool de conexões
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30")) # segundos
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # segundos
+
+    # Log de SQL (independente de FLASK_ENV; custoso em endpoints com muitas queries)
+    SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+
     # API Externa (Google Cloud Vision)
     GOOGLE_CLOUD_VISION_ENABLED = os.getenv("GOOGLE_CLOUD_VISION_ENABLED", "false").lower() == "true"
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -22,6 +31,15 @@ class Config:
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
     MIN_TAG_CONFIDENCE = float(os.getenv("MIN_TAG_CONFIDENCE", "0.7")) # 70% de confiança
     MAX_TAGS_PER_FILE = int(os.getenv("MAX_TAGS_PER_FILE", "15")) # 15 tags no máximo por arquivo
+    PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", "4")) # threads de análise em segundo plano
+    PROCESSING_STALE_AFTER = int(os.getenv("PROCESSING_STALE_AFTER", "300")) # segundos até reagendar pendentes órfãos
+
+    # Cache das estatísticas
+    STATISTICS_CACHE_TTL = int(os.getenv("STATISTICS_CACHE_TTL", "60")) # segundos
+
+    # Paginação das listagens
+    DEFAULT_PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 200
 
     # Flask
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
@@ -1,14 +1,35 @@
-from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, JSON
+import threading
+from datetime import datetime, timedelta
+from cachetools import TTLCache, cached
+from sqlalchemy import create_engine, insert, update, delete, func, text, cast, Column, Index, Integer, String, Text, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Mapped, mapped_column
+from sqlalchemy.orm import sessionmaker, scoped_session, Mapped, mapped_column
 
 from app.config import config
 from typing import List, Optional
 
 Base = declarative_base()
-engine = create_engine(config.DATABASE_URL, echo=config.DEBUG)
-SessionLocal = sessionmaker(bind=engine)
+engine = create_engine(
+    config.DATABASE_URL,
+    echo=config.SQL_ECHO,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=True  # Descarta conexões mortas antes do uso
+)
+# Sessão vinculada ao contexto atual; removida no teardown da aplicação
+SessionLocal = scoped_session(sessionmaker(bind=engine))
+
+# Cache das estatísticas (leitura frequente, tolera atraso de até STATISTICS_CACHE_TTL)
+_stats_cache = TTLCache(maxsize=1, ttl=config.STATISTICS_CACHE_TTL)
+_stats_lock = threading.Lock()
+
+def check_database_connection():
+    """Valida a conexão com o banco (falha rápido na inicialização)"""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
 
 class FileModel(Base):
     """Modelo de arquivo no banco de dados"""
@@ -19,10 +40,16 @@ class FileModel(Base):
     file_path: Mapped[str] = mapped_column(String, nullable=False)
     file_type: Mapped[str] = mapped_column(String, nullable=False)
     category: Mapped[str] = mapped_column(String, nullable=False, index=True)
-    tags: Mapped[List[str]] = mapped_column(JSON, nullable=False)
+    tags: Mapped[List[str]] = mapped_column(JSONB, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False, default="processed")  # pending | processed | error
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # GIN (jsonb_ops) atende os operadores ?, ?| e ?& usados na busca por tags
+        Index("ix_files_tags_gin", "tags", postgresql_using="gin"),
+    )
+
 class StorageService:
     """Serviço de armazenamento e recuperação de arquivos"""
 
@@ -30,152 +57,263 @@ class StorageService:
         Base.metadata.create_all(bind=engine)
 
     def get_session(self):
-        """Cria nova sessão do banco de dados"""
+        """Retorna a sessão do banco de dados da requisição atual"""
         return SessionLocal()
     
-    def save_file_metadata(self, filename, file_path, file_type, category, tags):
+    def save_file_metadata(self, filename, file_path, file_type, category, tags, status="processed"):
         """Salva metadados arquivo no banco de dados"""
         session = self.get_session()
         try:
-            file_record = FileModel(
+            # INSERT ... RETURNING: insere e obtém a linha em uma única ida ao banco
+            stmt = insert(FileModel).values(
                 filename=filename,
                 file_path=file_path,
                 file_type=file_type,
                 category=category,
-                tags=tags
-            )
-            session.add(file_record)
+                tags=self._normalize_tags(tags),
+                status=status
+            ).returning(FileModel)
+            file_record = session.scalars(stmt).one()
+
+            # Converte antes do commit para não recarregar os atributos expirados
+            file_data = self._to_dict(file_record)
             session.commit()
-            session.refresh(file_record)
+            self._invalidate_statistics()
 
-            return self._to_dict(file_record)  # ✅ Retorna dict em vez de model
+            return file_data  # ✅ Retorna dict em vez de model
+        
+        except Exception as e:
+            session.rollback()
+            raise e
+
+    def save_files_metadata(self, files):
+        """Salva metadados de vários arquivos em lote (lista de dicts)"""
+        session = self.get_session()
+        try:
+            rows = [{**f, "tags": self._normalize_tags(f["tags"])} for f in files]
+            file_records = session.scalars(
+                insert(FileModel).returning(FileModel), rows
+            ).all()
+
+            files_data = [self._to_dict(f) for f in file_records]
+            session.commit()
+            self._invalidate_statistics()
+
+            return files_data
         
         except Exception as e:
             session.rollback()
             raise e
-        finally:
-            session.close()
 
     def get_file_by_id(self, file_id):
         """Busca arquivo pelo ID"""
         session = self.get_session()
-        try:
-            file_record = session.query(FileModel).filter(FileModel.id == file_id).first()
-            return self._to_dict(file_record) if file_record else None
-        finally:
-            session.close()
+        # session.get consulta o identity map antes de emitir SELECT
+        file_record = session.get(FileModel, file_id)
+        return self._to_dict(file_record) if file_record else None
 
-    def get_all_files(self):
-        """Lista todos os arquivos"""
+    def get_all_files(self, limit=50, after_id=None):
+        """Lista arquivos paginados (mais recentes primeiro)"""
         session = self.get_session()
-        try:
-            files = session.query(FileModel).all()
-            return [self._to_dict(f) for f in files]
-        finally:
-            session.close()
+        files = self._paginate(session.query(FileModel), limit, after_id)
+        return [self._to_dict(f) for f in files]
+
+    def list_files_slim(self, category=None, limit=50, after_id=None):
+        """Lista paginada apenas com as colunas exibidas na listagem"""
+        session = self.get_session()
+        query = session.query(
+            FileModel.id, FileModel.filename, FileModel.category, FileModel.created_at
+        )
+        if category:
+            query = query.filter(FileModel.category == category)
+
+        rows = self._paginate(query, limit, after_id)
+        return [
+            {'id': r.id, 'filename': r.filename, 'category': r.category, 'created_at': r.created_at}
+            for r in rows
+        ]
 
     def get_files_by_tags(self, tags):
         """Busca arquivos por tags"""
         session = self.get_session()
-        try:
-            files = session.query(FileModel).all()
-            
-            # Filtra arquivos que contêm qualquer uma das tags buscadas
-            search_lower = {tag.lower() for tag in tags}
-            matching_files = [
-                f for f in files
-                if any(tag.lower() in search_lower for tag in f.tags)
-            ]
-            
-            return [self._to_dict(f) for f in matching_files]
-        finally:
-            session.close()
 
-    def get_files_by_category(self, category):
-        """Busca arquivos por categoria"""
+        # Filtra no banco os arquivos que contêm qualquer uma das tags buscadas (JSONB ?|)
+        search_lower = self._normalize_tags(tags)
+        files = session.query(FileModel).filter(
+            FileModel.tags.has_any(cast(search_lower, ARRAY(Text)))
+        ).all()
+        
+        return [self._to_dict(f) for f in files]
+
+    def get_files_by_category(self, category, limit=50, after_id=None):
+        """Busca arquivos por categoria, paginados"""
         session = self.get_session()
-        try:
-            files = session.query(FileModel).filter(
-                FileModel.category == category
-            ).all()
-            return [self._to_dict(f) for f in files]
-        finally:
-            session.close()
+        query = session.query(FileModel).filter(FileModel.category == category)
+        files = self._paginate(query, limit, after_id)
+        return [self._to_dict(f) for f in files]
     
     def update_file_tags(self, file_id, new_tags):
         """Atualiza tags de um arquivo"""
         session = self.get_session()
         try:
-            file_record = session.query(FileModel).filter(FileModel.id == file_id).first()
+            file_record = session.get(FileModel, file_id)
 
             if not file_record:
                 return None
             
-            file_record.tags = new_tags
+            file_record.tags = self._normalize_tags(new_tags)
             file_record.updated_at = datetime.utcnow()
             session.commit()
             session.refresh(file_record)
+            self._invalidate_statistics()
 
             return self._to_dict(file_record)
         
         except Exception as e:
             session.rollback()
             raise e 
-        finally:
-            session.close()
 
-    def delete_file(self, file_id):
-        """Remove arquivo do banco"""
+    def update_processing_result(self, file_id, tags, status="processed"):
+        """Grava o resultado do processamento em segundo plano de um arquivo
+
+        Só atualiza arquivos ainda pendentes: um resultado duplicado (job
+        reagendado) não sobrescreve o que já foi gravado.
+        """
         session = self.get_session()
         try:
-            file_record = session.query(FileModel).filter(FileModel.id == file_id).first()
-            
-            if not file_record:
-                return False
-            
-            session.delete(file_record)
+            stmt = update(FileModel).where(
+                FileModel.id == file_id,
+                FileModel.status == "pending"
+            ).values(
+                tags=self._normalize_tags(tags),
+                status=status,
+                updated_at=datetime.utcnow()
+            ).returning(FileModel)
+            file_record = session.scalars(stmt).one_or_none()
+
+            file_data = self._to_dict(file_record)
             session.commit()
+
+            if file_record is not None:
+                self._invalidate_statistics()
+
+            return file_data
+        
+        except Exception as e:
+            session.rollback()
+            raise e
+
+    def touch_pending_files(self, file_ids):
+        """Renova updated_at dos arquivos ainda pendentes (heartbeat dos jobs em andamento)
+
+        Retorna os ids que continuam pendentes.
+        """
+        if not file_ids:
+            return []
+
+        session = self.get_session()
+        try:
+            stmt = update(FileModel).where(
+                FileModel.id.in_(list(file_ids)),
+                FileModel.status == "pending"
+            ).values(updated_at=datetime.utcnow()).returning(FileModel.id)
+            touched_ids = session.scalars(stmt).all()
+            session.commit()
+
+            return touched_ids
+        
+        except Exception as e:
+            session.rollback()
+            raise e
+
+    def claim_stale_pending_files(self, max_age_seconds, exclude_ids=()):
+        """Reserva arquivos pendentes há mais de max_age_seconds (jobs perdidos)
+
+        Renova updated_at na mesma instrução, então cada arquivo é reservado
+        por apenas um processo. Retorna (id, file_path, file_type).
+        """
+        session = self.get_session()
+        try:
+            now = datetime.utcnow()
+            stmt = update(FileModel).where(
+                FileModel.status == "pending",
+                FileModel.updated_at < now - timedelta(seconds=max_age_seconds)
+            )
+            if exclude_ids:
+                stmt = stmt.where(FileModel.id.not_in(list(exclude_ids)))
+
+            stmt = stmt.values(updated_at=now).returning(
+                FileModel.id, FileModel.file_path, FileModel.file_type
+            )
+            rows = session.execute(stmt).all()
+            session.commit()
+
+            return [tuple(row) for row in rows]
+        
+        except Exception as e:
+            session.rollback()
+            raise e
+
+    def delete_file_and_get_path(self, file_id):
+        """Remove arquivo do banco e retorna o caminho em disco (None se não existir)"""
+        session = self.get_session()
+        try:
+            # DELETE ... RETURNING: remove e obtém o caminho em uma única ida ao banco
+            stmt = delete(FileModel).where(FileModel.id == file_id).returning(FileModel.file_path)
+            file_path = session.execute(stmt).scalar_one_or_none()
+            session.commit()
+
+            if file_path is not None:
+                self._invalidate_statistics()
             
-            return True
+            return file_path
         
         except Exception as e:
             session.rollback()
             raise e
-        finally:
-            session.close()
 
+    @cached(_stats_cache, key=lambda self: "statistics", lock=_stats_lock)
     def get_statistics(self):
         """Retorna estatísticas gerais"""
         session = self.get_session()
-        try:
-            total_files = session.query(FileModel).count()
+        total_files = session.query(func.count(FileModel.id)).scalar()
 
-            # Conta arquivos por categoria
-            categories = {}
-            for file in session.query(FileModel.category).all():
-                cat = file.category
-                categories[cat] = categories.get(cat, 0) + 1
+        # Conta arquivos por categoria
+        categories = dict(
+            session.query(FileModel.category, func.count())
+            .group_by(FileModel.category)
+            .all()
+        )
         
-            # Conta tags mais usadas
-            tag_count = {}
-            for file in session.query(FileModel).all():
-                for tag in file.tags:
-                    tag_lower = tag.lower()
-                    tag_count[tag_lower] = tag_count.get(tag_lower, 0) + 1
-
-            top_tags = sorted(
-                tag_count.items(),
-                key=lambda x: x[1],
-                reverse=True
-            )[:10]
-
-            return {
-                "total_files": total_files,
-                "categories": categories,
-                "top_tags": dict(top_tags)
-            }
-        finally:
-            session.close()
+        # Conta tags mais usadas (agregação feita no banco)
+        top_tags = session.execute(text("""
+            SELECT lower(tag) AS t, COUNT(*) AS c
+            FROM files_secondary, jsonb_array_elements_text(tags) AS tag
+            GROUP BY lower(tag)
+            ORDER BY c DESC, t
+            LIMIT 10
+        """)).all()
+
+        return {
+            "total_files": total_files,
+            "categories": categories,
+            "top_tags": dict(top_tags)
+        }
+
+    def _invalidate_statistics(self):
+        """Descarta estatísticas cacheadas após alterações nos arquivos"""
+        with _stats_lock:
+            _stats_cache.clear()
+
+    def _paginate(self, query, limit, after_id):
+        """Paginação por keyset em id decrescente (after_id é o cursor)"""
+        if after_id is not None:
+            query = query.filter(FileModel.id < after_id)
+        return query.order_by(FileModel.id.desc()).limit(limit).all()
+
+    def _normalize_tags(self, tags):
+        """Normaliza tags para minúsculas (forma armazenada e indexada)"""
+        return [tag.strip().lower() for tag in tags]
 
     def _to_dict(self, file_record):
         """Converte modelo para dicionário"""
@@ -189,6 +327,7 @@ class StorageService:
             'file_type': file_record.file_type,
             'category': file_record.category,
             'tags': file_record.tags,
-            'created_at': file_record.created_at.isoformat(),
-            'updated_at': file_record.updated_at.isoformat()
+            'status': file_record.status,
+            'created_at': file_record.created_at,
+            'updated_at': file_record.updated_at
         }
\ No newline at end of file
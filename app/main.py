@@ -1,11 +1,14 @@
 from flask import Flask
 from flask_cors import CORS
 from app.config import config
-from app.routes.files import files_bp
+from app.utils.json_provider import ORJSONProvider
+from app.routes.files import files_bp, processing_queue
+from app.database.storage_service import SessionLocal, check_database_connection
 
 def create_app():
     """Factory para criar a aplicação Flask"""
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
 
     # Configurações da aplicação
     app.config["SECRET_KEY"] = config.SECRET_KEY
@@ -14,6 +17,9 @@ def create_app():
     # Inicializa diretórios 
     config.init_app()
 
+    # Valida conexão com o banco de dados
+    check_database_connection()
+
     # CORS
     CORS(app, resources={
         r"/api/*": {
@@ -26,6 +32,14 @@ def create_app():
     # Registro dos Blueprints
     app.register_blueprint(files_bp)
 
+    # Reagenda arquivos que ficaram pendentes (jobs perdidos em reinícios)
+    processing_queue.start_recovery()
+
+    # Libera a sessão do banco ao final de cada requisição
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        SessionLocal.remove()
+
     # Rota raiz
     @app.route("/")
     def index():
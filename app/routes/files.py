@@ -3,8 +3,11 @@ from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
 
+from app.config import config
+
 from app.services.file_processor import FileProcessor
 from app.services.tag_analyzer import TagAnalyzer
+from app.services.processing_queue import ProcessingQueue
 from app.database.storage_service import StorageService
 from app.utils.validators import validate_file
 
@@ -14,10 +17,11 @@ files_bp = Blueprint("file_bp", __name__, url_prefix="/api/files")
 file_processor = FileProcessor()
 tag_analyzer = TagAnalyzer()
 storage_service = StorageService()  
+processing_queue = ProcessingQueue(file_processor, tag_analyzer, storage_service)
 
 @files_bp.route("/process", methods=["POST"])
 def process_file():
-    """Processa upload de arquivo e gera tags automaticamente"""
+    """Recebe upload de arquivo e agenda a geração automática de tags"""
     try:
         # Validação do arquivo
         if "file" not in request.files:
@@ -40,35 +44,49 @@ def process_file():
         # Salva o arquivo 
         file_path = file_processor.save_file(file, filename)
 
-        # Processa o arquivo
+        # Identifica o tipo do arquivo
         mime_type = file_processor.get_file_type(filename)
         category = file_processor.get_file_category(mime_type)
-        raw_tags = file_processor.analyze_file(file_path, mime_type)
-
-        # Processa tags
-        final_tags = tag_analyzer.process_tags(raw_tags)
 
-        # Armazena informações no banco de dados
+        # Registra o arquivo como pendente no banco de dados
         file_data = storage_service.save_file_metadata(
             filename=filename,
             file_path=file_path,
             file_type=mime_type,
             category=category,
-            tags=final_tags
+            tags=[],
+            status="pending"
         )
 
+        # Análise e geração de tags em segundo plano
+        processing_queue.enqueue(file_data["id"], file_path, mime_type)
+
         return jsonify({
-            "message": "Arquivo processado com sucesso.",
+            "message": "Arquivo recebido. Processamento em andamento.",
             "file_id": file_data["id"],
             "file_path": file_path,
             "category": category,
-            "tags": final_tags,
+            "status": file_data["status"],
             "created_at": file_data["created_at"]
-        }), 201
+        }), 202
     
     except Exception as e:
         return jsonify({"error": f"Erro ao processar o arquivo: {str(e)}"}), 500
 
+@files_bp.route("/<int:file_id>", methods=["GET"])
+def get_file(file_id):
+    """Retorna dados de um arquivo específico (inclui status do processamento)"""
+    try:
+        file_data = storage_service.get_file_by_id(file_id)
+
+        if not file_data:
+            return jsonify({"error": "Arquivo não encontrado."}), 404
+        
+        return jsonify(file_data), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Erro ao buscar arquivo: {str(e)}"}), 500
+
 @files_bp.route("/<int:file_id>/tags", methods=["GET"])
 def get_file_tags(file_id):
     """Retorna tags de um arquivo específico"""
@@ -100,6 +118,14 @@ def update_file_tags(file_id):
         if not isinstance(new_tags, list):
             return jsonify({"error": "Tags devem ser uma lista."}), 400
         
+        current = storage_service.get_file_by_id(file_id)
+        if not current:
+            return jsonify({"error": "Arquivo não encontrado."}), 404
+
+        # O resultado do processamento em segundo plano sobrescreveria as tags
+        if current["status"] == "pending":
+            return jsonify({"error": "Arquivo ainda em processamento. Tente novamente em instantes."}), 409
+        
         # Processa novas tags
         processed_tags = tag_analyzer.process_tags(new_tags)
 
@@ -145,18 +171,29 @@ def search_files():
     
 @files_bp.route("", methods=["GET"])
 def list_files():
-    """Lista todos os arquivos"""
+    """Lista arquivos com paginação por cursor (after_id)"""
     try:
         category = request.args.get("category")
+        limit = request.args.get("limit", default=config.DEFAULT_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, config.MAX_PAGE_SIZE))
+        after_id = request.args.get("after_id", type=int)
+        full = request.args.get("full", "").lower() in ("1", "true")
         
-        if category:
-            files = storage_service.get_files_by_category(category)
+        if not full:
+            # Projeção enxuta (id, filename, category, created_at)
+            files = storage_service.list_files_slim(category, limit=limit, after_id=after_id)
+        elif category:
+            files = storage_service.get_files_by_category(category, limit=limit, after_id=after_id)
         else:
-            files = storage_service.get_all_files()
+            files = storage_service.get_all_files(limit=limit, after_id=after_id)
+
+        # Página cheia indica que pode haver mais resultados
+        next_cursor = files[-1]["id"] if len(files) == limit else None
         
         return jsonify({
             "count": len(files),
-            "files": files
+            "files": files,
+            "next_cursor": next_cursor
         }), 200
     
     except Exception as e:
@@ -166,26 +203,20 @@ def list_files():
 def delete_file(file_id):
     """Deleta um arquivo específico"""
     try:
-        # Busca arquivo para obter o path
-        file_data = storage_service.get_file_by_id(file_id)
+        # Remove do banco de dados e obtém o caminho do arquivo
+        file_path = storage_service.delete_file_and_get_path(file_id)
 
-        if not file_data:
+        if file_path is None:
             return jsonify({"error": "Arquivo não encontrado."}), 404
         
         # Remove arquivo do disco
-        if os.path.exists(file_data["file_path"]):
-            os.remove(file_data["file_path"])
-        
-        # Remove do banco de dados
-        success = storage_service.delete_file(file_id)
-
-        if success:
-            return jsonify({
-                "message": "Arquivo removido com sucesso.",
-                "file_id": file_id
-            }), 200
-        else:
-            return jsonify({"error": "Erro ao remover o arquivo."}), 500
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+        return jsonify({
+            "message": "Arquivo removido com sucesso.",
+            "file_id": file_id
+        }), 200
 
     except Exception as e:
         return jsonify({"error": f"Erro ao remover o arquivo: {str(e)}"}), 500
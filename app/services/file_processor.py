@@ -1,11 +1,21 @@
 import os 
+import shutil
 import mimetypes
+from functools import lru_cache
 from pathlib import Path
+import numpy as np
 from PIL import Image
-from PyPDF2 import PdfReader
+from pypdf import PdfReader
 from app.config import config
+from app.utils.keyword_matcher import compile_keywords
 from app.services.vision_service import VisionService
 
+@lru_cache(maxsize=512)
+def _guess_mime_type(ext):
+    """Tipo MIME por extensão (cacheado, extensões se repetem muito)"""
+    mime_type, _ = mimetypes.guess_type("file" + ext)
+    return mime_type or "application/octet-stream"
+
 class FileProcessor:
     """Processador de arquivos com análise local otimizada"""
 
@@ -90,6 +100,26 @@ class FileProcessor:
             'check': None
         }
     ]
+
+    # Índice extensão -> configuração de análise de texto (lookup O(1))
+    TEXT_ANALYSIS_BY_EXT = {ext: cfg for cfg in TEXT_ANALYSIS_MAP for ext in cfg['exts']}
+
+    # Tags extras por extensão de mídia
+    VIDEO_EXT_TAGS = {
+        '.mp4': ['mp4', 'h264'], 
+        '.avi': ['avi'], 
+        '.mov': ['mov', 'quicktime'], 
+        '.mkv': ['mkv', 'matroska'], 
+        '.webm': ['webm', 'vp9']
+    }
+
+    AUDIO_EXT_TAGS = {
+        '.mp3': ['mp3', 'mpeg'], 
+        '.wav': ['wav', 'lossless'],
+        '.flac': ['flac', 'lossless', 'high-quality'],
+        '.ogg': ['ogg', 'vorbis'], 
+        '.m4a': ['m4a', 'aac']
+    }
     
     # Keywords para PDF
     PDF_KEYWORDS = {
@@ -102,6 +132,20 @@ class FileProcessor:
         'report': ['report', 'relatório', 'análise'],
         'presentation': ['presentation', 'apresentação', 'slide']
     }
+    PDF_KEYWORDS_RE, PDF_KEYWORD_CATEGORIES = compile_keywords(PDF_KEYWORDS)
+
+    # Paleta para classificação da cor dominante
+    COLOR_PALETTE = np.array(
+        [[255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 255, 255], [0, 0, 0]], dtype=np.int32
+    )
+    COLOR_PALETTE_LABELS = ['red', 'green', 'blue', 'bright', 'dark']
+    COLOR_MAX_DISTANCE = 150
+
+    # Tamanho máximo da miniatura usada na análise de cor
+    THUMBNAIL_SIZE = (512, 512)
+
+    # Tamanho do buffer de escrita dos uploads
+    COPY_BUFFER_SIZE = 1024 * 1024  # 1 MB
 
     def __init__(self):
         self.upload_folder = config.UPLOAD_FOLDER
@@ -111,22 +155,27 @@ class FileProcessor:
     def save_file(self, file, filename):
         """Salva o arquivo no disco e retorna o caminho"""
         file_path = self.upload_folder / filename
-        file.save(str(file_path))
+
+        # Cópia em blocos de 1 MB direto do stream do upload
+        with open(file_path, "wb") as dst:
+            shutil.copyfileobj(file.stream, dst, length=self.COPY_BUFFER_SIZE)
+
         return str(file_path)
     
     def get_file_type(self, filename):
         """Retorna o tipo MIME do arquivo"""
-        mime_type, _ = mimetypes.guess_type(filename)
-        return mime_type or "application/octet-stream"
+        return _guess_mime_type(os.path.splitext(filename)[1].lower())
     
-    def get_file_category(self, mime_type):
-        """Categoriza o arquivo usando lookups em dicionários"""
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def get_file_category(mime_type):
+        """Categoriza o arquivo usando lookups em dicionários (cacheado por MIME)"""
         # Verifica correspondência exata
-        if mime_type in self.MIME_EXACT:
-            return self.MIME_EXACT[mime_type]
+        if mime_type in FileProcessor.MIME_EXACT:
+            return FileProcessor.MIME_EXACT[mime_type]
         
         # Verifica prefixos
-        for prefix, category in self.MIME_PREFIXES.items():
+        for prefix, category in FileProcessor.MIME_PREFIXES.items():
             if mime_type.startswith(prefix):
                 return category
             
@@ -156,7 +205,9 @@ class FileProcessor:
         try:
             # Análise local básica
             with Image.open(file_path) as img:
+                # Metadados lidos do cabeçalho, antes de decodificar os pixels
                 width, height = img.size
+                mode = img.mode
                 tags = ["image"]
 
                 if img.format:
@@ -187,7 +238,7 @@ class FileProcessor:
                     'LA': ['grayscale', 'black-white'],
                     'RGBA': ['color', 'transparent']
                 }
-                tags.extend(mode_map.get(img.mode, []))
+                tags.extend(mode_map.get(mode, []))
 
                 # Análise de cor dominante
                 self._analyze_dominant_color(img, tags)
@@ -208,24 +259,31 @@ class FileProcessor:
     def _analyze_dominant_color(self, img, tags):
         """Extrai cor dominante da imagem"""
         try:
-            img_small = img.resize((1, 1))
-            color = img_small.getpixel((0, 0))
-
-            if isinstance(color, int):
+            # Imagens sem canais de cor (L, P, LA...) não têm cor dominante
+            if len(img.getbands()) < 3:
                 return
-                
-            r, g, b = color[0], color[1], color[2]
-
-            if r > 200 and g < 100 and b < 100:
-                tags.append('red')
-            elif r < 100 and g > 200 and b < 100:
-                tags.append('green')
-            elif r < 100 and g < 100 and b > 200:
-                tags.append('blue')
-            elif r > 200 and g > 200 and b > 200:
-                tags.append('bright')
-            elif r < 50 and g < 50 and b < 50:
-                tags.append('dark')
+
+            # Decodifica em resolução reduzida (draft usa a escala DCT do JPEG)
+            # e trabalha sobre uma miniatura; falhas de decodificação só
+            # descartam a tag de cor
+            img.draft("RGB", self.THUMBNAIL_SIZE)
+            img.thumbnail(self.THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+
+            # Miniatura 32x32 classificada pixel a pixel pelo centróide mais próximo
+            small = np.asarray(
+                img.convert("RGB").resize((32, 32), Image.Resampling.BOX), dtype=np.int32
+            ).reshape(-1, 3)
+            dist = ((small[:, None, :] - self.COLOR_PALETTE[None, :, :]) ** 2).sum(axis=-1)
+            idx = dist.argmin(axis=1)
+
+            # Pixels distantes de todas as cores ficam no bucket "sem cor" (último)
+            labels = self.COLOR_PALETTE_LABELS
+            idx[dist.min(axis=1) >= self.COLOR_MAX_DISTANCE ** 2] = len(labels)
+            counts = np.bincount(idx, minlength=len(labels) + 1)
+
+            dominant = int(counts.argmax())
+            if dominant < len(labels):
+                tags.append(labels[dominant])
         except:
             pass
        
@@ -247,19 +305,23 @@ class FileProcessor:
                 else:
                     tags.extend(["long-document", "book", "manual"])
 
-                # Extração de texto e verificação de palavras-chave(keywords)
-                text_sample = "".join([p.extract_text() for p in pdf.pages[:3]]).lower()
+                # Extração de texto página a página e verificação de palavras-chave(keywords)
+                word_count = 0
+                found_categories = set()
+                for page in pdf.pages[:3]:
+                    page_text = (page.extract_text() or "").lower()
+                    word_count += len(page_text.split())
+
+                    for keyword in set(self.PDF_KEYWORDS_RE.findall(page_text)):
+                        found_categories.update(self.PDF_KEYWORD_CATEGORIES[keyword])
 
-                if text_sample:
-                    if len(text_sample.split()) > 1000:
-                        tags.append("text-heavy")
+                    # Encerra cedo se nada mais pode mudar nas tags
+                    if len(found_categories) == len(self.PDF_KEYWORDS) and word_count > 1000:
+                        break
 
-                    # Busca eficiente por categorias 
-                    found_categories = {
-                        category for category, keywords in self.PDF_KEYWORDS.items()
-                        if any(k in text_sample for k in keywords)
-                    }
-                    tags.extend(list(found_categories))
+                if word_count > 1000:
+                    tags.append("text-heavy")
+                tags.extend(list(found_categories))
 
             return tags
         except Exception as e:
@@ -270,19 +332,18 @@ class FileProcessor:
     def analyze_text(self, file_path):
         """Análise otimizada de arquivos de texto"""
         try:
-            file_lower = file_path.lower()
+            ext = os.path.splitext(file_path)[1].lower()
             tags = ["text"]
 
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
                 content = file.read(10000)
 
-                # Itera sobre configurações de análise
-                for config in self.TEXT_ANALYSIS_MAP:
-                    if any(file_lower.endswith(ext) for ext in config["exts"]):
-                        tags.extend(config["tags"])
-                        if config["check"]:
-                            tags.extend(config["check"](content))
-                        break
+                # Busca a configuração de análise pela extensão
+                config = self.TEXT_ANALYSIS_BY_EXT.get(ext)
+                if config:
+                    tags.extend(config["tags"])
+                    if config["check"]:
+                        tags.extend(config["check"](content))
                 
                 if content.count('\n') > 100:
                     tags.append("large-file")
@@ -295,36 +356,18 @@ class FileProcessor:
 
     def analyze_video(self, file_path):
         """Análise de arquivos de vídeo"""
-        ext_map = {
-            '.mp4': ['mp4', 'h264'], 
-            '.avi': ['avi'], 
-            '.mov': ['mov', 'quicktime'], 
-            '.mkv': ['mkv', 'matroska'], 
-            '.webm': ['webm', 'vp9']
-        }
-        return self._analyze_media_ext(file_path, "video", ext_map)
+        return self._analyze_media_ext(file_path, "video", self.VIDEO_EXT_TAGS)
 
 
     def analyze_audio(self, file_path):
         """Análise de arquivos de áudio"""
-        ext_map = {
-             '.mp3': ['mp3', 'mpeg'], 
-            '.wav': ['wav', 'lossless'],
-            '.flac': ['flac', 'lossless', 'high-quality'],
-            '.ogg': ['ogg', 'vorbis'], 
-            '.m4a': ['m4a', 'aac']
-        }
-        return self._analyze_media_ext(file_path, 'audio', ext_map)
+        return self._analyze_media_ext(file_path, 'audio', self.AUDIO_EXT_TAGS)
 
     def _analyze_media_ext(self, file_path, base_tag, mapping):
         """Helper genérico para análise de mídia"""
         tags = [base_tag, "media"]
-        file_lower = file_path.lower()
-
-        for ext, extras in mapping.items():
-            if file_lower.endswith(ext):
-                tags.extend(extras)
-                break
+        ext = os.path.splitext(file_path)[1].lower()
+        tags.extend(mapping.get(ext, []))
         
         return tags
 
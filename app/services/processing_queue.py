@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import config
+from app.database.storage_service import SessionLocal
+
+class ProcessingQueue:
+    """Fila de processamento de arquivos em segundo plano"""
+
+    def __init__(self, file_processor, tag_analyzer, storage_service):
+        self.file_processor = file_processor
+        self.tag_analyzer = tag_analyzer
+        self.storage_service = storage_service
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.PROCESSING_WORKERS,
+            thread_name_prefix="file-processing"
+        )
+
+        # Arquivos na fila ou em processamento neste processo
+        self._active_ids = set()
+        self._active_lock = threading.Lock()
+
+    def enqueue(self, file_id, file_path, mime_type):
+        """Agenda a análise de um arquivo já salvo e registrado como pendente"""
+        with self._active_lock:
+            if file_id in self._active_ids:
+                return None
+            self._active_ids.add(file_id)
+
+        try:
+            return self.executor.submit(self._run_pipeline, file_id, file_path, mime_type)
+        except Exception:
+            with self._active_lock:
+                self._active_ids.discard(file_id)
+            raise
+
+    def start_recovery(self):
+        """Reagenda pendentes órfãos agora e a cada metade de PROCESSING_STALE_AFTER"""
+        self.recover_stale_jobs()
+
+        # Intervalo menor que o limite: o heartbeat mantém os jobs deste processo
+        # sempre mais novos que PROCESSING_STALE_AFTER
+        timer = threading.Timer(config.PROCESSING_STALE_AFTER / 2, self.start_recovery)
+        timer.daemon = True
+        timer.start()
+
+    def recover_stale_jobs(self):
+        """Reagenda arquivos pendentes cujo job se perdeu (reinício ou queda do processo)"""
+        try:
+            with self._active_lock:
+                active_ids = set(self._active_ids)
+
+            # Heartbeat: jobs deste processo não são considerados perdidos por outros
+            self.storage_service.touch_pending_files(active_ids)
+
+            stale_files = self.storage_service.claim_stale_pending_files(
+                config.PROCESSING_STALE_AFTER, exclude_ids=active_ids
+            )
+            for file_id, file_path, mime_type in stale_files:
+                self.enqueue(file_id, file_path, mime_type)
+
+            if stale_files:
+                print(f"Reagendados {len(stale_files)} arquivos pendentes")
+        except Exception as e:
+            print(f"Erro ao reagendar arquivos pendentes: {e}")
+        finally:
+            SessionLocal.remove()
+
+    def _run_pipeline(self, file_id, file_path, mime_type):
+        """Analisa o arquivo, processa as tags e grava o resultado no banco"""
+        try:
+            # Heartbeat no início; arquivo já processado (ou removido) não é reanalisado
+            if not self.storage_service.touch_pending_files([file_id]):
+                return
+
+            raw_tags = self.file_processor.analyze_file(file_path, mime_type)
+            final_tags = self.tag_analyzer.process_tags(raw_tags)
+            self.storage_service.update_processing_result(file_id, final_tags)
+        except Exception as e:
+            print(f"Erro no processamento do arquivo {file_id}: {e}")
+            try:
+                self.storage_service.update_processing_result(file_id, [], status="error")
+            except Exception as db_error:
+                print(f"Erro ao registrar falha do arquivo {file_id}: {db_error}")
+        finally:
+            with self._active_lock:
+                self._active_ids.discard(file_id)
+
+            # Cada thread usa sua própria sessão (scoped_session por thread)
+            SessionLocal.remove()
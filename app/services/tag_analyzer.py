@@ -1,5 +1,50 @@
+import heapq
+import sys
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
 from app.config import config
 
+# Mapeamento de sinônimos para normalização
+TAG_SYNONYMS = {
+    'jpg': 'jpeg',
+    'jpeg': 'jpeg',
+    'png': 'png',
+    'gif': 'gif',
+    'pic': 'image',
+    'picture': 'image',
+    'photo': 'image',
+    'img': 'image',
+    'movie': 'video',
+    'clip': 'video',
+    'sound': 'audio',
+    'music': 'audio',
+    'doc': 'document',
+    'paper': 'document',
+    'file': 'document',
+    'code': 'programming',
+    'script': 'programming',
+    'dev': 'development',
+    'frontend': 'front-end',
+    'backend': 'back-end'
+}
+
+@lru_cache(maxsize=4096)
+def _canonical_tag(tag: str) -> str:
+    """Forma canônica (strip + minúsculas, internada) de uma tag str"""
+    return sys.intern(tag.strip().lower())
+
+@lru_cache(maxsize=4096)
+def _normalize_one(tag: str) -> str:
+    """Normaliza uma tag str aplicando sinônimos (cacheado por tag)"""
+    tag_lower = _canonical_tag(tag)
+    return sys.intern(TAG_SYNONYMS.get(tag_lower, tag_lower))
+
+@lru_cache(maxsize=256)
+def _prepare_search_tags(search_tags: tuple) -> frozenset:
+    """Conjunto canônico das tags de busca (cacheado por consulta)"""
+    return frozenset(_canonical_tag(tag) for tag in search_tags)
+
 class TagAnalyzer:
     """Gerenciador de tags com filtragem e normalização"""
     
@@ -9,29 +54,8 @@ class TagAnalyzer:
         'unknown', 'error', 'other', 'undefined'
     }
 
-    # Mapeamento de sinônimos para normalização
-    TAG_SYNONYMS = {
-        'jpg': 'jpeg',
-        'jpeg': 'jpeg',
-        'png': 'png',
-        'gif': 'gif',
-        'pic': 'image',
-        'picture': 'image',
-        'photo': 'image',
-        'img': 'image',
-        'movie': 'video',
-        'clip': 'video',
-        'sound': 'audio',
-        'music': 'audio',
-        'doc': 'document',
-        'paper': 'document',
-        'file': 'document',
-        'code': 'programming',
-        'script': 'programming',
-        'dev': 'development',
-        'frontend': 'front-end',
-        'backend': 'back-end'
-    }
+    # Mapeamento de sinônimos (definido no módulo, usado pelos helpers cacheados)
+    TAG_SYNONYMS = TAG_SYNONYMS
     
     # Prioridade de tags para ordenação
     TAG_PRIORITY = {
@@ -59,91 +83,81 @@ class TagAnalyzer:
 
     def normalize_tags(self, tags):
         """Normaliza e filtra tags usando dicionários de sinônimos"""
-        normalized = []
-
-        for tag in tags:
-            tag_lower = tag.lower()
-            # Aplica sinônimo se existir
-            normalized_tag = self.TAG_SYNONYMS.get(tag_lower, tag_lower)
-            normalized.append(normalized_tag)
-        
-        return normalized
+        return [_normalize_one(tag) for tag in tags]
     
     def filter_tags(self, tags):
         """Remove tags indesejadas e duplicadas"""
-        # Remove duplicatas mantendo ordem
-        seen = set()
-        filtered = []
-
-        for tag in tags:
-            tag_lower = tag.lower()
-            if tag_lower not in seen and tag_lower not in self.COMMON_TAGS_TO_REMOVE:
-                seen.add(tag_lower)
-                filtered.append(tag_lower)
-
-        return filtered
+        return self._dedupe(tags, _canonical_tag)
     
     def prioritize_tags(self, tags):
         """Ordena tags com base na prioridade definida e limita quantidade"""
-        # Ordena usando prioridade (maior primeiro) e alfabeticamente como desempate
-        sorted_tags = sorted(
-            tags,
-            key=lambda t: (self.TAG_PRIORITY.get(t, 0), t),
-            reverse=True
-        )
+        # Ordena usando prioridade (maior primeiro) e alfabeticamente como desempate;
+        # chaves pré-computadas para a comparação de tuplas rodar toda em C
+        priority = self.TAG_PRIORITY.get
+        keyed = [(-priority(t, 0), t) for t in tags]
+        limit = self.max_tags
+
+        # Muitas tags para poucas vagas: seleção parcial O(n log k) em vez de ordenar tudo
+        if len(keyed) > limit * 4:
+            return [t for _, t in heapq.nsmallest(limit, keyed)]
+
+        keyed.sort()
 
         # Limita ao máximo configurado
-        return sorted_tags[:self.max_tags]
+        return [t for _, t in keyed[:limit]]
     
     def process_tags(self,raw_tags):
         """Pipeline completo de processamento de tags"""
-        # 1. Normaliza tags
-        normalized = self.normalize_tags(raw_tags)
-
-        # 2. Filtra tags
-        filtered = self.filter_tags(normalized)
+        # 1 + 2. Normaliza e filtra em uma única passada
+        filtered = self._dedupe(raw_tags, _normalize_one)
 
         # 3. Prioriza tags e as limita
-        final = self.prioritize_tags(filtered)
-
-        return final
+        return self.prioritize_tags(filtered)
     
     def merge_tags(self, *tag_lists):
         """Mescla múltiplas listas de tags, removendo duplicatas e reprocessando"""
-        all_tags = []
-        for tags in tag_lists:
-            all_tags.extend(tags)
-
-        return self.process_tags(all_tags)
+        return self.process_tags(chain.from_iterable(tag_lists))
     
     def add_custom_tags(self, existing_tags, custom_tags):
         """Adiciona tags customizadas às existentes e reprocessa"""
         return self.merge_tags(existing_tags, custom_tags)
     
+    def prepare_search_tags(self, search_tags):
+        """Prepara as tags de busca uma vez para reutilizar em vários arquivos"""
+        return _prepare_search_tags(tuple(sorted(search_tags)))
+
     def search_by_tags(self, search_tags, file_tags):
-        """"Verifica se o arquivo corresponde aos critérios de busca"""
-        search_lower = {tag.lower() for tag in search_tags}
-        file_lower = {tag.lower() for tag in file_tags}
+        """"Verifica se o arquivo corresponde aos critérios de busca
+
+        search_tags pode ser o frozenset de prepare_search_tags; file_tags
+        devem estar normalizadas (forma armazenada no banco).
+        """
+        if not isinstance(search_tags, frozenset):
+            search_tags = self.prepare_search_tags(search_tags)
 
-        # Retorna True se qualquer tag de busca está presente
-        return bool(search_lower & file_lower)
+        # Retorna True se qualquer tag de busca está presente (para no primeiro acerto)
+        return not search_tags.isdisjoint(file_tags)
     
     def get_tag_statistics(self, all_files_tags):
         """Gera estatísticas básicas de uso sobre as tags fornecidas"""
-        tag_count = {}
-
-        for file_tags in all_files_tags:
-            for tag in file_tags:
-                tag_lower = tag.lower()
-                tag_count[tag_lower] = tag_count.get(tag_lower, 0) + 1
+        tag_count = Counter(
+            tag.lower() for tag in chain.from_iterable(all_files_tags)
+        )
 
         # Ordena por frequência
-        sorted_stats = dict(sorted(
-            tag_count.items(),
-            key=lambda item: item[1],
-            reverse=True
-        ))
+        return dict(tag_count.most_common())
+    
+    def _dedupe(self, tags, transform):
+        """Aplica transform a cada tag e remove vazias, bloqueadas e duplicadas (mantém ordem)"""
+        seen = set()
+        result = []
 
-        return dict(sorted_stats)
+        # Nomes locais evitam lookups de atributo a cada tag
+        blocked = self.COMMON_TAGS_TO_REMOVE
+        for tag in tags:
+            tag = transform(tag)
+            if tag and tag not in seen and tag not in blocked:
+                seen.add(tag)
+                result.append(tag)
 
-        
\ No newline at end of file
+        return result
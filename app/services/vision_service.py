@@ -1,6 +1,20 @@
 import os
+import re
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, List, Dict, Optional
+import numpy as np
 from app.config import config
+from app.utils.keyword_matcher import compile_keywords
+
+try:
+    from google.cloud import vision as _vision
+except ImportError:
+    _vision = None
 
 class VisionService:
     """Serviço de análise de imagens com Google Cloud Vision API"""
@@ -13,6 +27,24 @@ class VisionService:
         "TEXT_DETECTION": {"max_results": 5},
     }
 
+    # Limite de imagens por chamada batch_annotate_images (documentado pelo Vision)
+    MAX_BATCH_SIZE = 16
+
+    # Lotes enviados em paralelo por batch_analyze_images
+    BATCH_WORKERS = 4
+
+    # Quantidade de resultados mantidos no cache por conteúdo (LRU)
+    CACHE_SIZE = 1024
+
+    # Imagens no Cloud Storage são lidas diretamente pelo Vision
+    GCS_URI_PREFIX = "gs://"
+
+    # Distância máxima (RGB) para associar uma cor a um nome
+    COLOR_MAX_DISTANCE = 150
+
+    # Bits descartados por canal na tabela de cores quantizada (4 bits -> 16 níveis)
+    COLOR_LUT_SHIFT = 4
+
     # Mapeamento de cores para nomes
     COLOR_NAMES = {
         (255, 0, 0): 'red',
@@ -27,6 +59,19 @@ class VisionService:
         (128, 128, 128): 'gray'        
     }
 
+    # Keywords de tipos de documento detectados no texto (keyword -> tag)
+    DOC_KEYWORDS = {
+        'invoice': 'invoice',
+        'receipt': 'receipt',
+        'contract': 'contract',
+        'certificate': 'certificate',
+        'diploma': 'diploma'
+    }
+    DOC_KEYWORDS_RE = re.compile("|".join(DOC_KEYWORDS))
+
+    # Quantidade máxima de caracteres do OCR analisados
+    TEXT_SCAN_LIMIT = 4096
+
     # Categorias de labels para simplificação
     LABEL_CATEGORIES = {
         'nature': ['sky', 'cloud', 'tree', 'flower', 'grass', 'mountain', 'water', 'ocean', 'beach'],
@@ -38,20 +83,38 @@ class VisionService:
         'animal': ['animal', 'pet', 'dog', 'cat', 'bird', 'wildlife'],
         'sport': ['sport', 'game', 'athlete', 'competition', 'exercise', 'fitness']
     }
+    LABEL_KEYWORDS_RE, LABEL_KEYWORD_CATEGORIES = compile_keywords(LABEL_CATEGORIES)
+    LABEL_CATEGORY_RANK = {category: rank for rank, category in enumerate(LABEL_CATEGORIES)}
 
     def __init__(self):
         self.enabled = config.GOOGLE_CLOUD_VISION_ENABLED
         self.client: Any = None
+
+        # Paleta de cores como matriz (10, 3) para busca vetorizada
+        self._palette = np.array(list(self.COLOR_NAMES.keys()), dtype=np.int32)
+        self._palette_names = list(self.COLOR_NAMES.values())
+        self._palette_items = list(self.COLOR_NAMES.items())
+        self._lut = self._build_color_lut()
+
+        # Cache de tags por hash do conteúdo da imagem (evita chamadas pagas repetidas)
+        self._tag_cache: "OrderedDict[bytes, List[str]]" = OrderedDict()
+        self._tag_cache_lock = threading.Lock()
         
+        if self.enabled and _vision is None:
+            print("⚠️  Google Cloud Vision library not installed. Install with: pip install google-cloud-vision")
+            self.enabled = False
+
         if self.enabled:
             try:
-                from google.cloud import vision
                 if config.GOOGLE_APPLICATION_CREDENTIALS:
                     os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = config.GOOGLE_APPLICATION_CREDENTIALS
-                self.client = vision.ImageAnnotatorClient()
-            except ImportError:
-                print("⚠️  Google Cloud Vision library not installed. Install with: pip install google-cloud-vision")
-                self.enabled = False
+                self.client = _vision.ImageAnnotatorClient()
+
+                # Tipos do Vision guardados uma vez (caminho quente só acessa atributos)
+                self._Image = _vision.Image
+                self._ImageSource = _vision.ImageSource
+                self._very_unlikely = _vision.Likelihood.VERY_UNLIKELY
+                self._features = self._build_features()
             except Exception as e:
                 print(f"⚠️  Google Cloud Vision initialized failed: {e}")
                 self.enabled = False
@@ -68,42 +131,111 @@ class VisionService:
             return []
         
         try:
-            with open(image_path, "rb") as image_file:
-                content = image_file.read()
-
-            from google.cloud import vision
-            image = vision.Image(content=content)
-
-            # Executa todas as análises em paralelo
-            tags = []
-
-            # 1. Detecção de labels
-            tags.extend(self._analyze_labels(image))
-            
-            # 2. Propriedades da imagem (cores)
-            tags.extend(self._analyze_colors(image))
-            
-            # 3. Detecção de texto
-            tags.extend(self._analyze_text(image))
-            
-            # 4. Safe Search (conteúdo)
-            tags.extend(self._analyze_safe_search(image))
-            
+            if self._is_gcs_uri(image_path):
+                # Sem conteúdo local não há chave de cache
+                image, cache_key = self._build_image_source(image_path), None
+            else:
+                with self._open_image(image_path) as content:
+                    cache_key = self._cache_key(content)
+                    cached_tags = self._get_cached_tags(cache_key)
+                    if cached_tags is not None:
+                        return cached_tags
+
+                    # Cópia para bytes só quando a imagem realmente será enviada
+                    image = self._build_image(content[:])
+
+            # Uma única chamada com todas as features (executadas em paralelo pelo Vision)
+            request = {"image": image, "features": self._features}
+            response = self.client.batch_annotate_images(requests=[request]).responses[0]
+
+            tags = self._tags_from_response(response)
+            if cache_key is not None:
+                self._store_cached_tags(cache_key, tags)
             return tags
         
         except Exception as e:
             print(f"⚠️  Erro na análise com Vision API: {e}")
             return []
+
+    def _is_gcs_uri(self, image_path: str) -> bool:
+        """Verifica se a imagem é um objeto do Cloud Storage (gs://)"""
+        return image_path.startswith(self.GCS_URI_PREFIX)
+
+    @contextmanager
+    def _open_image(self, image_path: str):
+        """Mapeia o arquivo de imagem em memória (somente leitura, sem cópia)"""
+        with open(image_path, "rb") as image_file:
+            try:
+                mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Arquivos vazios não podem ser mapeados
+                yield b""
+                return
+
+            with mapped:
+                yield mapped
+
+    def _build_image(self, content: bytes):
+        """Monta vision.Image a partir do conteúdo"""
+        return self._Image(content=content)
+
+    def _build_image_source(self, image_uri: str):
+        """Monta vision.Image apontando para um objeto do Cloud Storage"""
+        return self._Image(source=self._ImageSource(image_uri=image_uri))
+
+    def _cache_key(self, content) -> bytes:
+        """Chave do cache: BLAKE2b (128 bits) do conteúdo"""
+        return hashlib.blake2b(content, digest_size=16).digest()
+
+    def _get_cached_tags(self, cache_key: bytes) -> Optional[List[str]]:
+        """Retorna cópia das tags cacheadas, se existirem"""
+        with self._tag_cache_lock:
+            tags = self._tag_cache.get(cache_key)
+            if tags is None:
+                return None
+            self._tag_cache.move_to_end(cache_key)
+            return list(tags)
+
+    def _store_cached_tags(self, cache_key: bytes, tags: List[str]) -> None:
+        """Armazena tags no cache, descartando a entrada menos recente"""
+        with self._tag_cache_lock:
+            self._tag_cache[cache_key] = list(tags)
+            self._tag_cache.move_to_end(cache_key)
+            if len(self._tag_cache) > self.CACHE_SIZE:
+                self._tag_cache.popitem(last=False)
+
+    def _build_features(self) -> List[Dict]:
+        """Monta a lista de features do request a partir de VISION_FEATURES"""
+        return [
+            {"type_": _vision.Feature.Type[name], **options}
+            for name, options in self.VISION_FEATURES.items()
+        ]
+
+    def _tags_from_response(self, response) -> List[str]:
+        """Extrai tags de um AnnotateImageResponse com todas as features"""
+        if response.error.message:
+            raise RuntimeError(response.error.message)
+
+        tags = []
+
+        # 1. Detecção de labels
+        tags.extend(self._analyze_labels(response))
+        
+        # 2. Propriedades da imagem (cores)
+        tags.extend(self._analyze_colors(response))
+        
+        # 3. Detecção de texto
+        tags.extend(self._analyze_text(response))
         
+        # 4. Safe Search (conteúdo)
+        tags.extend(self._analyze_safe_search(response))
         
-    def _analyze_labels(self, image) -> List[str]:
+        return tags
+        
+        
+    def _analyze_labels(self, response) -> List[str]:
         """Analisa labels/categorias da imagem"""
         try:
-            response = self.client.label_detection(
-                image=image,
-                max_results=self.VISION_FEATURES["LABEL_DETECTION"]["max_results"]
-            )
-
             tags = []
             for label in response.label_annotations:
                 if label.score >= config.MIN_TAG_CONFIDENCE:
@@ -122,11 +254,9 @@ class VisionService:
             return []
         
     
-    def _analyze_colors(self, image) -> List[str]:
+    def _analyze_colors(self, response) -> List[str]:
         """Analisa cores dominantes da imagem"""
         try:
-            response = self.client.image_properties(image=image)
-
             tags = []
             if response.image_properties_annotation.dominant_colors.colors:
                 # Pega as 3 cores mais dominantes
@@ -145,59 +275,39 @@ class VisionService:
             return []
         
     
-    def _analyze_text(self, image) -> List[str]:
+    def _analyze_text(self, response) -> List[str]:
         """Analisa texto na imagem"""
         try:
-            response = self.client.text_detection(image=image)
-
             tags = []
             if response.text_annotations:
                 tags.append("text-content")
 
                 # Analisa o primeiro bloco de texto (geralmente o mais relevante)
                 if len(response.text_annotations) > 0:
-                    text = response.text_annotations[0].description.lower()
-
-                    # Identifica documentos específicos
-                    doc_keywords = {
-                        'invoice': 'invoice',
-                        'receipt': 'receipt',
-                        'contract': 'contract',
-                        'certificate': 'certificate',
-                        'diploma': 'diploma'
-                    }
-
-                    for keyword, tag in doc_keywords.items():
-                        if keyword in text:
-                            tags.append(tag)
-
-                     
+                    # Limita o trecho analisado (o OCR completo pode ser enorme)
+                    text = response.text_annotations[0].description[:self.TEXT_SCAN_LIMIT].lower()
+
+                    # Identifica documentos específicos em uma única passada
+                    found = set(self.DOC_KEYWORDS_RE.findall(text))
+                    tags.extend(self.DOC_KEYWORDS[k] for k in self.DOC_KEYWORDS if k in found)
+
             return tags
         except Exception as e:
             print(f"Erro na detecção de texto: {e}")
             return []
         
     
-    def _analyze_safe_search(self, image) -> List[str]:
+    def _analyze_safe_search(self, response) -> List[str]:
         """Analisa conteúdo de segurança da imagem"""
         try:
-            response = self.client.safe_search_detection(image=image)
             safe = response.safe_search_annotation
-
-            # Mapeamento de níveis para tags
-            level_map = {
-                'VERY_UNLIKELY': None,
-                'UNLIKELY': None,
-                'POSSIBLE': 'flagged',
-                'LIKELY': 'flagged',
-                'VERY_LIKELY': 'flagged'
-            }
+            very_unlikely = self._very_unlikely
 
             tags = []
 
             # Verifica se é conteúdo profissional/seguro
-            if (safe.adult.name == "VERY_UNLIKELY" and
-                safe.violence.name == "VERY_UNLIKELY"):
+            # (comparação de enums inteiros; UNKNOWN não conta como seguro)
+            if safe.adult == very_unlikely and safe.violence == very_unlikely:
                 tags.append("professional")
                 tags.append("safe-content")
 
@@ -209,26 +319,62 @@ class VisionService:
     
     def _get_label_category(self, label: str) -> Optional[str]:
         """Retorna a categoria de um label, se existir"""
-        for category, keywords in self.LABEL_CATEGORIES.items():
-            if any(keyword in label for keyword in keywords):
-                return category
-        return None
+        # Uma passada no label; em caso de várias, vale a ordem de LABEL_CATEGORIES
+        matches = self.LABEL_KEYWORDS_RE.findall(label)
+        if not matches:
+            return None
+        return min(
+            (self.LABEL_KEYWORD_CATEGORIES[k][0] for k in matches),
+            key=self.LABEL_CATEGORY_RANK.__getitem__
+        )
     
-    def _get_closest_color_name(self, rgb: tuple) -> Optional[str]:
-        """Encontra o nome da cor mais próxima"""
-        min_distance = float("inf")
-        closest_color = None
+    def _build_color_lut(self) -> Dict[tuple, str]:
+        """Tabela (r>>4, g>>4, b>>4) -> nome para as células com resposta única"""
+        shift = self.COLOR_LUT_SHIFT
+        step = 1 << shift
+        levels = np.arange(256 >> shift, dtype=np.int32)
+        cells = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), -1).reshape(-1, 3)
+
+        # Os 8 vértices de cada célula; regiões de Voronoi e o raio máximo são convexos,
+        # então se todos os vértices têm a mesma resposta, a célula inteira também tem
+        offsets = np.array(np.meshgrid(*[(0, step - 1)] * 3, indexing="ij"), dtype=np.int32).reshape(3, -1).T
+        corners = (cells << shift)[:, None, :] + offsets[None, :, :]
+        diff = corners[:, :, None, :] - self._palette[None, None, :, :]
+        distances = np.einsum("cvpk,cvpk->cvp", diff, diff)
+
+        closest = distances.argmin(axis=-1)
+        within = distances.min(axis=-1) < self.COLOR_MAX_DISTANCE ** 2
+        exact = (closest == closest[:, :1]).all(axis=1) & within.all(axis=1)
 
-        for known_rgb, color_name in self.COLOR_NAMES.items():
-            # Distância euclidiana no espaço RGB
-            distance = sum((a - b) ** 2 for a, b in zip(rgb, known_rgb)) ** 0.5
+        return {
+            tuple(int(c) for c in cell): self._palette_names[int(index)]
+            for cell, index in zip(cells[exact], closest[exact, 0])
+        }
 
+    def _get_closest_color_name(self, rgb: tuple) -> Optional[str]:
+        """Encontra o nome da cor mais próxima"""
+        shift = self.COLOR_LUT_SHIFT
+        name = self._lut.get((rgb[0] >> shift, rgb[1] >> shift, rgb[2] >> shift))
+        if name is not None:
+            return name
+
+        # Células ambíguas (fronteiras e limite de distância): busca completa
+        # Distância euclidiana ao quadrado em inteiros (dispensa a raiz); para uma
+        # única cor e 10 entradas o laço desenrolado é mais rápido que o NumPy
+        red, green, blue = rgb
+        closest_name = None
+        # Começa no limite: só retorna se a distância for razoável
+        min_distance = self.COLOR_MAX_DISTANCE ** 2
+        for (known_red, known_green, known_blue), name in self._palette_items:
+            dr = red - known_red
+            dg = green - known_green
+            db = blue - known_blue
+            distance = dr * dr + dg * dg + db * db
             if distance < min_distance:
                 min_distance = distance
-                closest_color = color_name
+                closest_name = name
 
-        # Só retorna se a distância for razoável
-        return closest_color if min_distance < 150 else None
+        return closest_name
     
 
     def batch_analyze_images(self, image_paths: List[str]) -> Dict[str, List[str]]:
@@ -236,9 +382,63 @@ class VisionService:
         if not self.is_available():
             return {}
         
+        # Lotes de até MAX_BATCH_SIZE imagens por chamada, enviados em paralelo
+        batches = [
+            image_paths[i:i + self.MAX_BATCH_SIZE]
+            for i in range(0, len(image_paths), self.MAX_BATCH_SIZE)
+        ]
+
         results = {}
+        with ThreadPoolExecutor(max_workers=self.BATCH_WORKERS) as executor:
+            for batch_results in executor.map(self._analyze_batch, batches):
+                results.update(batch_results)
+
+        return results
+
+    def _analyze_batch(self, image_paths: List[str]) -> Dict[str, List[str]]:
+        """Analisa um lote de imagens com uma única chamada batch_annotate_images"""
+        results = {path: [] for path in image_paths}
+        features = self._features
+
+        requests, pending = [], []
         for path in image_paths:
-            results[path] = self.analyze_image(path)
+            if self._is_gcs_uri(path):
+                requests.append({"image": self._build_image_source(path), "features": features})
+                pending.append((path, None))
+                continue
+
+            try:
+                with self._open_image(path) as content:
+                    cache_key = self._cache_key(content)
+                    cached_tags = self._get_cached_tags(cache_key)
+                    if cached_tags is not None:
+                        results[path] = cached_tags
+                        continue
+
+                    image = self._build_image(content[:])
+            except Exception as e:
+                print(f"⚠️  Erro ao ler imagem {path}: {e}")
+                continue
+
+            requests.append({"image": image, "features": features})
+            pending.append((path, cache_key))
+
+        if not requests:
+            return results
+
+        try:
+            responses = self.client.batch_annotate_images(requests=requests).responses
+        except Exception as e:
+            print(f"⚠️  Erro na análise em batch com Vision API: {e}")
+            return results
+
+        for (path, cache_key), response in zip(pending, responses):
+            try:
+                results[path] = self._tags_from_response(response)
+                if cache_key is not None:
+                    self._store_cached_tags(cache_key, results[path])
+            except Exception as e:
+                print(f"⚠️  Erro na análise com Vision API ({path}): {e}")
 
         return results
     
@@ -0,0 +1,16 @@
+import orjson
+from flask.json.provider import JSONProvider
+
+class ORJSONProvider(JSONProvider):
+    """Provider JSON do Flask baseado em orjson (serializa datetime nativamente)"""
+
+    # Datas são gravadas em UTC (datetime.utcnow) sem timezone
+    OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        """Serializa objeto para string JSON"""
+        return orjson.dumps(obj, option=self.OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        """Desserializa string/bytes JSON"""
+        return orjson.loads(s)
@@ -0,0 +1,24 @@
+import re
+
+def compile_keywords(keyword_map):
+    """Compila categoria -> keywords em uma única regex e no índice keyword -> categorias
+
+    As categorias de cada keyword seguem a ordem de keyword_map. A regex usa
+    lookahead para casar keywords sobrepostas em uma só passada, mas registra
+    apenas a keyword mais longa em cada posição; por isso nenhuma keyword pode
+    ser prefixo de outra (ex.: 'car' e 'carpet'), o que é validado aqui.
+    """
+    keyword_categories = {}
+    for category, keywords in keyword_map.items():
+        for keyword in keywords:
+            keyword_categories.setdefault(keyword, []).append(category)
+
+    ordered = sorted(keyword_categories)
+    for shorter, longer in zip(ordered, ordered[1:]):
+        if longer.startswith(shorter):
+            raise ValueError(f"Keyword '{shorter}' é prefixo de '{longer}'")
+
+    alternation = "|".join(
+        re.escape(k) for k in sorted(keyword_categories, key=len, reverse=True)
+    )
+    return re.compile(f"(?=({alternation}))"), keyword_categories
@@ -1,3 +1,6 @@
+import io
+import os
+import re
 from app.config import config
 
 class FileValidator:
@@ -19,7 +22,7 @@ class FileValidator:
     }
 
     # Conjunto completo de todas as extensões permitidas
-    ALL_ALLOWED_EXTENSIONS = set().union(*ALLOWED_EXTENSIONS.values())
+    ALL_ALLOWED_EXTENSIONS = frozenset().union(*ALLOWED_EXTENSIONS.values())
 
     # Tipos MIME permitidos
     DANGEROUS_MIME_TYPES = {
@@ -30,23 +33,41 @@ class FileValidator:
         'application/x-bat'
     }
 
+    # Streams com descritor de arquivo real (fileno() não tem efeitos colaterais)
+    DISK_FILE_TYPES = (io.FileIO, io.BufferedReader, io.BufferedRandom)
+
+    # Caracteres proibidos em nomes de arquivo
+    FORBIDDEN_CHARS_RE = re.compile(r'[\\/<>:"|?*]')
+
     @classmethod
     def is_allowed_extension(cls, filename):
         """Verifica se a extensão do arquivo é permitida"""
-        if '.' not in filename:
-            return False
-        
-        ext = filename.rsplit('.', 1)[1].lower()
-        return f".{ext}" in cls.ALL_ALLOWED_EXTENSIONS
+        # splitext já inclui o ponto e retorna '' quando não há extensão
+        ext = os.path.splitext(filename)[1].lower()
+        return ext in cls.ALL_ALLOWED_EXTENSIONS
 
     @classmethod
     def is_allowed_size(cls, file):
         """Verifica se o tamanho do arquivo é permitido"""
-        file.seek(0, 2) # Move para o final do arquivo
-        size = file.tell()
-        file.seek(0)   # Retorna ao início do arquivo
+        return cls._get_file_size(file) <= config.MAX_FILE_SIZE
+
+    @classmethod
+    def _get_file_size(cls, file):
+        """Mede o tamanho real do upload sem ler o conteúdo"""
+        stream = getattr(file, 'stream', file)
+
+        # Arquivos reais em disco: tamanho vem do sistema de arquivos
+        if isinstance(stream, cls.DISK_FILE_TYPES):
+            return os.fstat(stream.fileno()).st_size
+
+        # Demais streams (BytesIO, SpooledTemporaryFile...): mede pelo fim
+        # do stream e restaura a posição
+        position = stream.tell()
+        stream.seek(0, 2) # Move para o final do arquivo
+        size = stream.tell()
+        stream.seek(position)   # Retorna à posição original
 
-        return size <= config.MAX_FILE_SIZE
+        return size
 
     @classmethod
     def is_safe_mime_type(cls, mime_type):
@@ -64,8 +85,7 @@ class FileValidator:
             return False, "Nome de arquivo muito longo."
         
         # Caracteres proibidos
-        forbidden_chars = {'/', '\\', '<', '>', ':', '"', '|', '?', '*'}
-        if any(char in filename for char in forbidden_chars):
+        if cls.FORBIDDEN_CHARS_RE.search(filename):
             return False, "Nome de arquivo contém caracteres inválidos."
 
         return True, None